@@ -12,14 +12,134 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import itertools
+import re
+import time
+
 from robot.api import logger
 
+from DatabaseLibrary.query import _build_count_sql, _checked_identifier
+
+_TABLE_EXISTS_SQL = {
+    "cx_Oracle": "SELECT 1 FROM all_objects WHERE object_type IN ('TABLE','VIEW') AND owner = SYS_CONTEXT('USERENV', 'SESSION_USER') AND object_name = UPPER({marker}) AND ROWNUM = 1",
+    "sqlite3": "SELECT 1 FROM sqlite_master WHERE type='table' AND name={marker} COLLATE NOCASE LIMIT 1",
+    "ibm_db": "SELECT 1 FROM SYSIBM.SYSTABLES WHERE type='T' AND name=UPPER({marker}) FETCH FIRST 1 ROWS ONLY",
+    "ibm_db_dbi": "SELECT 1 FROM SYSIBM.SYSTABLES WHERE type='T' AND name=UPPER({marker}) FETCH FIRST 1 ROWS ONLY",
+    "pymssql": "SELECT TOP 1 1 FROM information_schema.tables WHERE table_name={marker}",
+}
+_DEFAULT_TABLE_EXISTS_SQL = "SELECT 1 FROM information_schema.tables WHERE table_name={marker}"
+
+# PEP 249 paramstyle -> positional bind marker; a single bound value is all the assertions need.
+_PARAMSTYLE_MARKERS = {
+    "qmark": "?",
+    "numeric": ":1",
+    "named": ":1",
+    "format": "%s",
+    "pyformat": "%s",
+}
+
+_SNOWFLAKE_COMPARE_STRUCTURE_SQL = ("select count(*) from information_schema.columns columns_left "
+                                    "full outer join information_schema.columns columns_right "
+                                    "on columns_left.column_name = columns_right.column_name "
+                                    "where columns_left.table_schema = %s and columns_left.table_name = %s "
+                                    "and columns_right.table_schema = %s and columns_right.table_name = %s "
+                                    "and (columns_left.data_type <> columns_right.data_type "
+                                    "or columns_left.ordinal_position <> columns_right.ordinal_position)")
+
+_COMPARE_STRUCTURE_SQL = ("WITH DB AS (SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM ALL_TAB_COLUMNS "
+                          "WHERE OWNER = :schema AND TABLE_NAME = :tbl), "
+                          "VW_STRUC AS (SELECT * FROM EDW_TALEND.{compare_table_name}_VIEW_STRUCTURE "
+                          "WHERE TABLE_NAME = :resolved) "
+                          "SELECT COUNT(*) FROM DB FULL OUTER JOIN VW_STRUC ON VW_STRUC.COLUMN_NAME = DB.COLUMN_NAME "
+                          "WHERE DB.COLUMN_NAME IS NULL OR VW_STRUC.COLUMN_NAME IS NULL")
+
+# Assertions run entirely inside the database when `Enable Server Side Assertions` is active: the block raises an
+# error tagged with `_SERVER_ASSERT_MARKER` and the observed value when the assertion fails, and returns no result set
+# when it passes.
+_SERVER_ASSERT_MARKER = 'robot-assert:'
+_SERVER_ASSERT_SQL = {
+    "psycopg2": {
+        "exists": "DO $robot_assert$ BEGIN IF NOT EXISTS (%(sql)s\n) THEN "
+                  "RAISE EXCEPTION 'robot-assert:0'; END IF; END $robot_assert$",
+        "count": "DO $robot_assert$ DECLARE n bigint; BEGIN SELECT COUNT(*) INTO n FROM (%(sql)s\n) AS sub; "
+                 "IF n <> %(expected)d THEN RAISE EXCEPTION 'robot-assert:%%', n; END IF; END $robot_assert$",
+    },
+    "cx_Oracle": {
+        "exists": "DECLARE n NUMBER; BEGIN SELECT COUNT(*) INTO n FROM dual WHERE EXISTS (%(sql)s\n); "
+                  "IF n = 0 THEN RAISE_APPLICATION_ERROR(-20999, 'robot-assert:0'); END IF; END;",
+        "count": "DECLARE n NUMBER; BEGIN SELECT COUNT(*) INTO n FROM (%(sql)s\n); "
+                 "IF n <> %(expected)d THEN RAISE_APPLICATION_ERROR(-20999, 'robot-assert:' || n); END IF; END;",
+    },
+}
+
+# only queries can be nested in a subquery; anything else (e.g. PRAGMA, SHOW, EXEC) is run as-is
+_QUERY_RE = re.compile(r'(SELECT|WITH)\b', re.IGNORECASE)
+
+# number of offending rows shown in the message of `Check If Not Exists In Database`
+_SAMPLE_SIZE = 5
+
+
+def _as_int(value):
+    """
+    Converts a row count given as int, str or bytes (as passed in from a robot file) to int.
+    """
+    return int(value)
+
 
 class Assertion(object):
     """
     Assertion handles all the assertions of Database Library.
     """
 
+    def enable_assertion_cache(self, ttl_seconds=5):
+        """
+        Caches the outcome of the existence and row count queries run by the assertion keywords for `ttl_seconds`, so
+        repeating the same assertion with the same statement does not hit the database again. The cache is cleared
+        whenever SQL is executed through `Query`, `Row Count`, `Description`, `Execute Sql Script`,
+        `Execute Sql String`, `Delete All Rows From Table` or `Call Stored Procedure`, and on connect and disconnect.
+
+        Example:
+        | Enable Assertion Cache | |
+        | Enable Assertion Cache | 30 |
+        """
+        logger.info('Executing : Enable Assertion Cache  |  ' + str(ttl_seconds))
+        self._assertion_cache_ttl = float(ttl_seconds)
+        self._clear_assertion_cache()
+
+    def disable_assertion_cache(self):
+        """
+        Turns off the cache enabled by `Enable Assertion Cache`.
+
+        Example:
+        | Disable Assertion Cache |
+        """
+        logger.info('Executing : Disable Assertion Cache')
+        self._assertion_cache_ttl = None
+        self._clear_assertion_cache()
+
+    def enable_server_side_assertions(self):
+        """
+        Runs `Check If Exists In Database` and `Row Count Is Equal To X` as a single anonymous block on the database
+        server (PL/pgSQL on psycopg2, PL/SQL on cx_Oracle), so no result rows are sent back to the client. Other
+        modules, calls with `sansTran` set to True and servers that reject the block (e.g. Redshift, which has no
+        `DO`) keep using the regular client-side checks.
+
+        Example:
+        | Enable Server Side Assertions |
+        """
+        logger.info('Executing : Enable Server Side Assertions')
+        self._server_side_assertions = True
+
+    def disable_server_side_assertions(self):
+        """
+        Turns off the server-side checks enabled by `Enable Server Side Assertions`.
+
+        Example:
+        | Disable Server Side Assertions |
+        """
+        logger.info('Executing : Disable Server Side Assertions')
+        self._server_side_assertions = False
+
     def check_if_exists_in_database(self, selectStatement, sansTran=False):
         """
         Check if any row would be returned by given the input `selectStatement`. If there are no results, then this will
@@ -41,8 +161,13 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Check If Exists In Database | SELECT id FROM person WHERE first_name = 'John' | True |
         """
-        logger.info ('Executing : Check If Exists In Database  |  %s ' % selectStatement)
-        if not self.query(selectStatement, sansTran):
+        logger.info('Executing : Check If Exists In Database  |  ' + selectStatement)
+        exists = None
+        if self._use_server_side_assert(sansTran):
+            exists = self._server_side_assert('exists', selectStatement)
+        if exists is None:
+            exists = self._exists_in_database(selectStatement, sansTran)
+        if not exists:
             raise AssertionError("Expected to have have at least one row from '%s' "
                                  "but got 0 rows." % selectStatement)
 
@@ -69,11 +194,15 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Check If Not Exists In Database | SELECT id FROM person WHERE first_name = 'John' | True |
         """
-        logger.info('Executing : Check If Not Exists In Database  |  %s ' % selectStatement)
-        queryResults = self.query(selectStatement, sansTran)
-        if queryResults:
+        logger.info('Executing : Check If Not Exists In Database  |  ' + selectStatement)
+        if self._exists_in_database(selectStatement, sansTran):
+            rows = self._stream_query(selectStatement, sansTran, _SAMPLE_SIZE)
+            try:
+                sample = list(itertools.islice(rows, _SAMPLE_SIZE))
+            finally:
+                rows.close()
             raise AssertionError("Expected to have have no rows from '%s' "
-                                 "but got some rows : %s." % (selectStatement, queryResults))
+                                 "but got some rows (showing at most %s) : %s." % (selectStatement, _SAMPLE_SIZE, sample))
 
     def row_count_is_0(self, selectStatement, sansTran=False):
         """
@@ -96,9 +225,9 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Row Count is 0 | SELECT id FROM person WHERE first_name = 'John' | True |
         """
-        logger.info('Executing : Row Count Is 0  |  %s ' % selectStatement)
-        num_rows = self.row_count(selectStatement, sansTran)
-        if num_rows > 0:
+        logger.info('Executing : Row Count Is 0  |  ' + selectStatement)
+        if self._row_count_up_to(selectStatement, 1, sansTran) > 0:
+            num_rows = self._row_count(selectStatement, sansTran)
             raise AssertionError("Expected zero rows to be returned from '%s' "
                                  "but got rows back. Number of rows returned was %s" % (selectStatement, num_rows))
 
@@ -124,9 +253,14 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Row Count Is Equal To X | SELECT id FROM person WHERE first_name = 'John' | 0 | True |
         """
-        logger.info('Executing : Row Count Is Equal To X  |  %s  |  %s ' % (selectStatement, numRows))
-        num_rows = self.row_count(selectStatement, sansTran)
-        if num_rows != int(numRows.encode('ascii')):
+        logger.info('Executing : Row Count Is Equal To X  |  ' + selectStatement + '  |  ' + str(numRows))
+        expected = _as_int(numRows)
+        num_rows = None
+        if self._use_server_side_assert(sansTran):
+            num_rows = self._server_side_assert('count', selectStatement, expected)
+        if num_rows is None:
+            num_rows = self._cached_row_count(selectStatement, sansTran)
+        if num_rows != expected:
             raise AssertionError("Expected same number of rows to be returned from '%s' "
                                  "than the returned rows of %s" % (selectStatement, num_rows))
 
@@ -152,9 +286,10 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Row Count Is Greater Than X | SELECT id FROM person | 1 | True |
         """
-        logger.info('Executing : Row Count Is Greater Than X  |  %s  |  %s ' % (selectStatement, numRows))
-        num_rows = self.row_count(selectStatement, sansTran)
-        if num_rows <= int(numRows.encode('ascii')):
+        logger.info('Executing : Row Count Is Greater Than X  |  ' + selectStatement + '  |  ' + str(numRows))
+        expected = _as_int(numRows)
+        num_rows = self._row_count_up_to(selectStatement, expected + 1, sansTran)
+        if num_rows <= expected:
             raise AssertionError("Expected more rows to be returned from '%s' "
                                  "than the returned rows of %s" % (selectStatement, num_rows))
 
@@ -180,9 +315,10 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Row Count Is Less Than X | SELECT id FROM person | 3 | True |
         """
-        logger.info('Executing : Row Count Is Less Than X  |  %s  |  %s ' % (selectStatement, numRows))
-        num_rows = self.row_count(selectStatement, sansTran)
-        if num_rows >= int(numRows.encode('ascii')):
+        logger.info('Executing : Row Count Is Less Than X  |  ' + selectStatement + '  |  ' + str(numRows))
+        expected = _as_int(numRows)
+        if self._row_count_up_to(selectStatement, expected, sansTran) >= expected:
+            num_rows = self._row_count(selectStatement, sansTran)
             raise AssertionError("Expected less rows to be returned from '%s' "
                                  "than the returned rows of %s" % (selectStatement, num_rows))
 
@@ -203,29 +339,23 @@ class Assertion(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | Table Must Exist | person | True |
         """
-        logger.info('Executing : Table Must Exist  |  %s ' % tableName)
-        if self.db_api_module_name in ["cx_Oracle"]:
-            selectStatement = ("SELECT * FROM all_objects WHERE object_type IN ('TABLE','VIEW') AND owner = SYS_CONTEXT('USERENV', 'SESSION_USER') AND object_name = UPPER('%s')" % tableName)
-        elif self.db_api_module_name in ["sqlite3"]:
-            selectStatement = ("SELECT name FROM sqlite_master WHERE type='table' AND name='%s' COLLATE NOCASE" % tableName)
-        elif self.db_api_module_name in ["ibm_db", "ibm_db_dbi"]:
-            selectStatement = ("SELECT name FROM SYSIBM.SYSTABLES WHERE type='T' AND name=UPPER('%s')" % tableName)
-        else:
-            selectStatement = ("SELECT * FROM information_schema.tables WHERE table_name='%s'" % tableName)
-        num_rows = self.row_count(selectStatement, sansTran)
-        if num_rows == 0:
+        logger.info('Executing : Table Must Exist  |  ' + tableName)
+        selectStatement = _TABLE_EXISTS_SQL.get(self.db_api_module_name, _DEFAULT_TABLE_EXISTS_SQL).format(
+            marker=self._parameter_marker())
+        found = self._cached(('table', tableName, sansTran),
+                             lambda: self._fetchone(selectStatement, sansTran, (tableName,)) is not None)
+        if not found:
             raise AssertionError("Table '%s' does not exist in the db" % tableName)
 
     def compare_table_structure_snowflake(self, script, test_schema_name, test_table_name, result_schema_name, result_table_name):
 
-        logger.info('Executing : Compare Table Structure for table |  %s ' % test_table_name)
+        logger.info('Executing : Compare Table Structure for table |  ' + test_table_name)
 
         # deploy table/view
         self.execute_sql_script(script)
 
-        query = f'select * from information_schema.columns columns_left full outer join information_schema.columns columns_right on columns_left.column_name = columns_right.column_name where columns_left.table_schema = \'{test_schema_name}\' and columns_left.table_name = \'{test_table_name}\' and columns_right.table_schema = \'{result_schema_name}\' and columns_right.table_name = \'{result_table_name}\' and (columns_left.data_type <> columns_right.data_type or columns_left.ordinal_position <> columns_right.ordinal_position)'
-
-        num_rows = self.row_count(query)
+        num_rows = int(self._fetchone(_SNOWFLAKE_COMPARE_STRUCTURE_SQL,
+                                      parameters=(test_schema_name, test_table_name, result_schema_name, result_table_name))[0])
 
         if num_rows > 0:
             raise AssertionError("Table structure of table '%s' does not match expected result. The number of faulty columns is '%s'" % (test_table_name, num_rows))
@@ -235,23 +365,23 @@ class Assertion(object):
 
     def compare_table_structure(self, test_table_name, schema_name, compare_table_name):
 
-        logger.info('Executing : Compare Table Structure for table |  %s ' % test_table_name)
+        logger.info('Executing : Compare Table Structure for table |  ' + test_table_name)
 
-        query = f'WITH DB AS (SELECT TABLE_NAME,COLUMN_NAME,DATA_TYPE FROM ALL_TAB_COLUMNS WHERE OWNER = \'{schema_name}\' AND TABLE_NAME IN (\'{test_table_name}\')), {compare_table_name}_VW_STRUC AS (SELECT * FROM EDW_TALEND.{compare_table_name}_VIEW_STRUCTURE WHERE TABLE_NAME = REPLACE(\'{test_table_name}\', \'VW_AVALOQ_{compare_table_name}_\', \'\')) SELECT * FROM DB FULL OUTER JOIN {compare_table_name}_VW_STRUC ON {compare_table_name}_VW_STRUC.COLUMN_NAME = DB.COLUMN_NAME WHERE DB.COLUMN_NAME IS NULL OR {compare_table_name}_VW_STRUC.COLUMN_NAME IS NULL'
+        query = _COMPARE_STRUCTURE_SQL.format(compare_table_name=_checked_identifier(compare_table_name))
+        resolved_table_name = test_table_name.replace(f'VW_AVALOQ_{compare_table_name}_', '')
 
-        num_rows = self.row_count(query)
+        num_rows = int(self._fetchone(query, parameters={'schema': schema_name, 'tbl': test_table_name,
+                                                         'resolved': resolved_table_name})[0])
 
         if num_rows > 0:
             raise AssertionError("Table structure of table '%s' does not match expected result. The number of faulty columns is '%s'" % (test_table_name, num_rows))
 
     def check_query_result(self, script, test_schema_name, test_table_name, result_schema_name, result_table_name, sansTrans=False):
 
-        logger.info('Executing : Compare Query Result |  %s ' % script)
+        logger.info('Executing : Compare Query Result |  ' + script)
 
-        # deploy table/view
-        self.execute_sql_script(script)
-
-        num_rows = self.compare_tables(test_schema_name, test_table_name, result_schema_name, result_table_name)
+        # deploy table/view and compare in one round-trip where the driver allows it
+        num_rows = self._execute_script_and_compare(script, test_schema_name, test_table_name, result_schema_name, result_table_name)
 
         if num_rows > 0:
             raise AssertionError("Result of script '%s' does not match expected result. The number of faulty rows is '%s'" % (script, num_rows))
@@ -270,31 +400,29 @@ class Assertion(object):
         
     def count_specific_table(self, schema_name, table_name, num_rows):
 
-        logger.info('Executing : Count for specific table: |  %s ' % table_name)
+        logger.info('Executing : Count for specific table: |  ' + table_name)
 
-        query = f'SELECT COUNT(*) FROM {schema_name}.{table_name}'
+        query = _build_count_sql(schema_name, table_name)
         
         self.row_count_is_equal_to_x(query, num_rows)
     
     def count_unique_rows_table2(self, schema_name, table_name, unique_key, num_rows):
 
-        logger.info('Executing : Count (unique rows) for table: |  %s ' % table_name)
+        logger.info('Executing : Count (unique rows) for table: |  ' + table_name)
 
-        uniqueRows = f'SELECT COUNT(DISTINCT {unique_key}) FROM {schema_name}.{table_name}'
+        uniqueRows = _build_count_sql(schema_name, table_name, unique_key)
         
         self.row_count_is_equal_to_x(uniqueRows, num_rows)
 
     def count_empty_column_value_percentage(self, schema_name, table_name, column_name, percentage):
 
-        query_total = f'SELECT * FROM {schema_name}.{table_name}'
-        query_column = f'SELECT * FROM {schema_name}.{table_name} WHERE {column_name} IS NULL'
-        
-        num_rows_total = self.row_count(query_total)
-        num_rows_columns = self.row_count(query_column)
-        
-        percentage_calculated = (num_rows_columns/num_rows_total) * 100
-        
-        if percentage_calculated > float(percentage):
+        marker = self._parameter_marker()
+        percentage_sql = f'100.0 * COUNT(CASE WHEN {column_name} IS NULL THEN 1 END) / NULLIF(COUNT(*), 0)'
+        query = f'SELECT CASE WHEN {percentage_sql} > {marker} THEN 1 ELSE 0 END, {percentage_sql} FROM {schema_name}.{table_name}'
+
+        exceeded, percentage_calculated = self._fetchone(query, parameters=(float(percentage),))
+
+        if exceeded == 1:
             raise AssertionError("Percentage of EMPTY columns is '%s' is higher than allow percentage '%s'" % (percentage_calculated, percentage))
  
     def row_unique_check2(self, count_key, count_total):
@@ -302,23 +430,21 @@ class Assertion(object):
         selectStatement1 = self.open_sql(count_key)
         selectStatement2 = self.open_sql(count_total)
         
-        cur = None
-        cur = self._dbconnection.cursor()
         result_key = self.query(selectStatement1)
         result_total = self.query(selectStatement2)
         
-        rowunique = round(float('.'.join(str(elem) for elem in result_key[0])))
-        objectrows = round(float('.'.join(str(elem) for elem in result_total[0])))
+        rowunique = int(result_key[0][0])
+        objectrows = int(result_total[0][0])
       
         if rowunique != objectrows:
             raise AssertionError("Key is not unique, total rows: '%s', key rows: '%s'" % (objectrows, rowunique))
 
     def value_variance_check(self, schema_name, table_name, unique_key, field):
-        logger.info('Executing : Values variance check: |  %s ' % table_name)
+        logger.info('Executing : Values variance check: |  ' + table_name)
         
         result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
 
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result_uniqueRows[0][0])
 
         if int(field) == 0:
             if uniqueRows != int(field):
@@ -337,13 +463,9 @@ class Assertion(object):
         SELECT COUNT(*), COUNT(DISTINCT {unique_key})
         FROM {schema_name}.{table_name}
         """
-        logger.info('Executing : Row unique check for table: |  %s ' % table_name)
+        logger.info('Executing : Row unique check for table: |  ' + table_name)
         
-        result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
-        result_objectRows = self.count_object_rows_table(schema_name, table_name)
-
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
-        objectRows = round(float('.'.join(str(elem) for elem in result_objectRows[0])))
+        objectRows, uniqueRows = self._count_and_distinct(schema_name, table_name, unique_key)
 
         logger.info("Object rows: '%s', unique rows '%s': '%s'" % (objectRows, unique_key, uniqueRows))
 
@@ -356,13 +478,13 @@ class Assertion(object):
         FROM {schema_name}.{table_name}
         WHERE {argument}
         """
-        logger.info('Executing : Row unique check for table: |  %s ' % table_name)
+        logger.info('Executing : Row unique check for table: |  ' + table_name)
         
-        result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
-        result_objectRows = self.count_object_rows_table_argument(schema_name, table_name, argument)
+        query = f'SELECT COUNT(DISTINCT {unique_key}), SUM(CASE WHEN ({argument}) THEN 1 ELSE 0 END) FROM {schema_name}.{table_name}'
+        result = self.query(query)
 
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
-        objectRows = round(float('.'.join(str(elem) for elem in result_objectRows[0])))
+        uniqueRows = int(result[0][0])
+        objectRows = int(result[0][1] or 0)
 
         logger.info("Object rows: '%s', unique rows '%s': '%s'" % (objectRows, unique_key, uniqueRows))
 
@@ -376,13 +498,13 @@ class Assertion(object):
         LEFT OUTER JOIN {foreign_table_name}
         ON {foreign_key} = {unique_key}
         """
-        logger.info('Executing : Dimensional integrity check: | Between tables %s and %s' % (table_name, foreign_table_name))
+        logger.info('Executing : Dimensional integrity check: | Between tables ' + table_name + ' and ' + foreign_table_name)
         
-        result_foundRows = self.count_found_rows_table(schema_name, table_name, unique_key, foreign_table_name, foreign_key)
-        result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
+        query = f'SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key}) FROM {schema_name}.{table_name} LEFT OUTER JOIN {foreign_table_name} ON {foreign_key} = {unique_key}'
+        result = self.query(query)
 
-        foundRows = round(float('.'.join(str(elem) for elem in result_foundRows[0])))
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result[0][0])
+        foundRows = int(result[0][1])
 
         logger.info("Unique rows '%s': '%s', found rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, foundRows))
 
@@ -397,13 +519,13 @@ class Assertion(object):
         ON {foreign_key} = {unique_key}
         AND {argument}
         """
-        logger.info('Executing : Dimensional integrity check: | Between tables %s and %s' % (table_name, foreign_table_name))
+        logger.info('Executing : Dimensional integrity check: | Between tables ' + table_name + ' and ' + foreign_table_name)
         
-        result_foundRows = self.count_found_rows_table_argument(schema_name, table_name, unique_key, foreign_table_name, foreign_key, argument)
-        result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
+        query = f'SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key}) FROM {schema_name}.{table_name} LEFT OUTER JOIN {foreign_table_name} ON {foreign_key} = {unique_key} AND {argument}'
+        result = self.query(query)
 
-        foundRows = round(float('.'.join(str(elem) for elem in result_foundRows[0])))
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result[0][0])
+        foundRows = int(result[0][1])
 
         logger.info("Unique rows '%s': '%s', found rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, foundRows))
 
@@ -419,13 +541,13 @@ class Assertion(object):
         ON {foreign_key} = {unique_key}
         WHERE {argument}
         """
-        logger.info('Executing : Dimensional integrity check: | Between tables %s and %s' % (table_name, foreign_table_name))
+        logger.info('Executing : Dimensional integrity check: | Between tables ' + table_name + ' and ' + foreign_table_name)
         
-        result_foundRows = self.count_found_rows_table(schema_name, table_name, unique_key, foreign_table_name, foreign_key)
-        result_uniqueRows = self.count_unique_rows_table_argument(schema_name, table_name, unique_key, argument)
+        query = f'SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key}) FROM {schema_name}.{table_name} LEFT OUTER JOIN {foreign_table_name} ON {foreign_key} = {unique_key} WHERE {argument}'
+        result = self.query(query)
 
-        foundRows = round(float('.'.join(str(elem) for elem in result_foundRows[0])))
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result[0][0])
+        foundRows = int(result[0][1])
 
         logger.info("Unique rows '%s': '%s', found rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, foundRows))
 
@@ -434,20 +556,19 @@ class Assertion(object):
     
     def dimensional_integrity_check_found_withClause_argument(self, schema_name, table_name, unique_key, argument, foreign_table_name, foreign_key):  
         """
-        WITH rel AS (SELECT {unique_key} FROM {schema_name}.{table_name})
+        WITH rel AS (SELECT {unique_key} FROM {schema_name}.{table_name} WHERE {argument})
         SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key})
         FROM rel
         LEFT OUTER JOIN {foreign_table_name}
         ON {foreign_key} = {unique_key}
-        WHERE {argument}
         """
-        logger.info('Executing : Dimensional integrity check: | Between tables %s and %s' % (table_name, foreign_table_name))
+        logger.info('Executing : Dimensional integrity check: | Between tables ' + table_name + ' and ' + foreign_table_name)
         
-        result_foundRows = self.count_found_rows_table_withClause(schema_name, table_name, unique_key, foreign_table_name, foreign_key)
-        result_uniqueRows = self.count_unique_rows_table_argument(schema_name, table_name, unique_key, argument)
+        query = f'WITH rel AS (SELECT {unique_key} FROM {schema_name}.{table_name} WHERE {argument}) SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key}) FROM rel LEFT OUTER JOIN {foreign_table_name} ON {foreign_key} = {unique_key}'
+        result = self.query(query)
 
-        foundRows = round(float('.'.join(str(elem) for elem in result_foundRows[0])))
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result[0][0])
+        foundRows = int(result[0][1])
 
         logger.info("Unique rows '%s': '%s', found rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, foundRows))
 
@@ -459,15 +580,122 @@ class Assertion(object):
         SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key})
         FROM {schema_name}.{table_name}
         """
-        logger.info('Executing : Dimensional integrity check: | %s' % table_name)
+        logger.info('Executing : Dimensional integrity check: | ' + table_name)
         
-        result_potentialRows = self.count_unique_rows_table(schema_name, table_name, foreign_key)
-        result_uniqueRows = self.count_unique_rows_table(schema_name, table_name, unique_key)
+        query = f'SELECT COUNT(DISTINCT {unique_key}), COUNT(DISTINCT {foreign_key}) FROM {schema_name}.{table_name}'
+        result = self.query(query)
 
-        potentialRows = round(float('.'.join(str(elem) for elem in result_potentialRows[0])))
-        uniqueRows = round(float('.'.join(str(elem) for elem in result_uniqueRows[0])))
+        uniqueRows = int(result[0][0])
+        potentialRows = int(result[0][1])
 
         logger.info("Unique rows '%s': '%s', found rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, potentialRows))
 
         if potentialRows != uniqueRows:
-            raise AssertionError("Unique rows '%s': '%s', potential rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, potentialRows))
\ No newline at end of file
+            raise AssertionError("Unique rows '%s': '%s', potential rows '%s': '%s'" % (unique_key, uniqueRows, foreign_key, potentialRows))
+
+    def _parameter_marker(self):
+        """
+        Returns the positional bind marker for the connected module's PEP 249 `paramstyle`, defaulting to `%s`.
+        """
+        return _PARAMSTYLE_MARKERS.get(self.db_api_paramstyle, "%s")
+
+    def _wrap_as_exists(self, selectStatement):
+        """
+        Rewrites `selectStatement` so that the database stops scanning after the first matching row. Returns None for
+        statements other than SELECT/WITH and for modules without a known rewrite, in which case the statement is run
+        as-is and only the first row is fetched. The closing parenthesis goes on its own line so a trailing `--` comment
+        cannot swallow it.
+        """
+        selectStatement = selectStatement.strip().rstrip(';')
+        if not _QUERY_RE.match(selectStatement):
+            return None
+        if self.db_api_module_name in ["cx_Oracle"]:
+            return "SELECT 1 FROM dual WHERE EXISTS (%s\n)" % selectStatement
+        elif self.db_api_module_name in ["ibm_db", "ibm_db_dbi"]:
+            return "SELECT 1 FROM SYSIBM.SYSDUMMY1 WHERE EXISTS (%s\n)" % selectStatement
+        elif self.db_api_module_name in ["MySQLdb", "pymysql"]:
+            return "SELECT 1 FROM DUAL WHERE EXISTS (%s\n)" % selectStatement
+        elif self.db_api_module_name in ["psycopg2", "sqlite3"]:
+            return "SELECT 1 WHERE EXISTS (%s\n)" % selectStatement
+        return None
+
+    def _wrap_with_limit(self, selectStatement, limit):
+        """
+        Rewrites `selectStatement` so that the database returns at most `limit` rows. Returns None for statements other
+        than SELECT/WITH and for modules where wrapping the statement in a derived table is not safe (e.g. duplicate
+        column names on MySQL, unnamed columns on SQL Server), in which case the statement is run as-is and only `limit`
+        rows are fetched. As in `_wrap_as_exists`, the closing parenthesis goes on its own line to survive a trailing
+        `--` comment.
+        """
+        selectStatement = selectStatement.strip().rstrip(';')
+        if not _QUERY_RE.match(selectStatement):
+            return None
+        if self.db_api_module_name in ["cx_Oracle"]:
+            return "SELECT 1 FROM (%s\n) WHERE ROWNUM <= %d" % (selectStatement, limit)
+        elif self.db_api_module_name in ["ibm_db", "ibm_db_dbi"]:
+            return "SELECT 1 FROM (%s\n) AS sub FETCH FIRST %d ROWS ONLY" % (selectStatement, limit)
+        elif self.db_api_module_name in ["psycopg2", "sqlite3"]:
+            return "SELECT 1 FROM (%s\n) AS sub LIMIT %d" % (selectStatement, limit)
+        return None
+
+    def _row_count_up_to(self, selectStatement, limit, sansTran=False):
+        """
+        Returns the number of rows of `selectStatement`, counting no further than `limit`.
+        """
+        limit = max(limit, 1)
+        limitedStatement = self._wrap_with_limit(selectStatement, limit) or selectStatement
+        return self._cached(('row_count_up_to', selectStatement, limit, sansTran),
+                            lambda: len(self._fetchmany(limitedStatement, limit, sansTran)))
+
+    def _use_server_side_assert(self, sansTran=False):
+        # a failing block aborts the transaction on PostgreSQL, so never run it inside a transaction kept open with
+        # sansTran; results of server-side assertions are not cached, so prefer the client-side path when caching is on
+        return (self._server_side_assertions and not sansTran and self.db_api_module_name in _SERVER_ASSERT_SQL
+                and self._assertion_cache_ttl is None)
+
+    def _server_side_assert(self, kind, selectStatement, expected=None):
+        """
+        Runs the `kind` assertion ('exists' or 'count') for `selectStatement` as a single anonymous block on the
+        database server. Returns the observed value: True or the `expected` row count when the assertion holds, False
+        or the actual row count reported by the server when it does not. Returns None when the server rejects the
+        block for any other reason, so the caller can fall back to the client-side check.
+        """
+        block = _SERVER_ASSERT_SQL[self.db_api_module_name][kind] % {
+            'sql': selectStatement.strip().rstrip(';'), 'expected': expected or 0}
+        try:
+            self._execute(block)
+        except Exception as error:
+            match = re.search(re.escape(_SERVER_ASSERT_MARKER) + r'(\d+)', str(error))
+            if match is None:
+                logger.info('Server-side assertion failed to run, falling back to client-side check  |  %s ' % error)
+                return None
+            if kind == 'exists':
+                return False
+            return int(match.group(1))
+        if kind == 'exists':
+            return True
+        return expected
+
+    def _exists_in_database(self, selectStatement, sansTran=False):
+        existsStatement = self._wrap_as_exists(selectStatement) or selectStatement
+        return self._cached(('exists', selectStatement, sansTran),
+                            lambda: self._fetchone(existsStatement, sansTran) is not None)
+
+    def _cached_row_count(self, selectStatement, sansTran=False):
+        return self._cached(('row_count', selectStatement, sansTran),
+                            lambda: self._row_count(selectStatement, sansTran))
+
+    def _cached(self, key, compute):
+        """
+        Returns the cached value for `key` if `Enable Assertion Cache` is active and the entry has not expired,
+        otherwise calls `compute` and caches its result.
+        """
+        if self._assertion_cache_ttl is None:
+            return compute()
+        now = time.monotonic()
+        entry = self._assertion_cache.get(key)
+        if entry is not None and now - entry[0] < self._assertion_cache_ttl:
+            return entry[1]
+        value = compute()
+        self._assertion_cache[key] = (now, value)
+        return value
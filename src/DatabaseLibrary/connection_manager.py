@@ -29,10 +29,14 @@ class ConnectionManager(object):
 
     def __init__(self):
         """
-        Initializes _dbconnection to None.
+        Initializes _dbconnection to None, and the assertion cache and server-side assertions as disabled.
         """
         self._dbconnection = None
         self.db_api_module_name = None
+        self.db_api_paramstyle = None
+        self._assertion_cache = {}
+        self._assertion_cache_ttl = None
+        self._server_side_assertions = False
 
     def connect_to_database(self, dbapiModuleName=None, dbName=None, dbUsername=None, dbPassword=None, dbHost=None, dbPort=None, dbCharset=None, dbDriver=None, dbConfigFile="./resources/db.cfg"):
         """
@@ -75,6 +79,8 @@ class ConnectionManager(object):
         | Connect To Database | psycopg2 | my_db_test |
         """
 
+        self._clear_assertion_cache()
+
         config = ConfigParser.ConfigParser()
         config.read([dbConfigFile])
 
@@ -91,6 +97,7 @@ class ConnectionManager(object):
         else:
             self.db_api_module_name = dbapiModuleName
             db_api_2 = importlib.import_module(dbapiModuleName)
+        self.db_api_paramstyle = getattr(db_api_2, 'paramstyle', None)
         if dbapiModuleName in ["MySQLdb", "pymysql"]:
             dbPort = dbPort or 3306
             logger.info('Connecting using : %s.connect(db=%s, user=%s, passwd=%s, host=%s, port=%s, charset=%s) ' % (dbapiModuleName, dbName, dbUsername, dbPassword, dbHost, dbPort, dbCharset))
@@ -166,7 +173,9 @@ class ConnectionManager(object):
 
         db_connect_string = 'db_api_2.connect(%s)' % db_connect_string
 
+        self._clear_assertion_cache()
         self.db_api_module_name = dbapiModuleName
+        self.db_api_paramstyle = getattr(db_api_2, 'paramstyle', None)
         logger.info('Executing : Connect To Database Using Custom Params : %s.connect(%s) ' % (dbapiModuleName, db_connect_string))
         self._dbconnection = eval(db_connect_string)
 
@@ -178,6 +187,7 @@ class ConnectionManager(object):
         | Disconnect From Database | # disconnects from current connection to the database |
         """
         logger.info('Executing : Disconnect From Database')
+        self._clear_assertion_cache()
         if self._dbconnection==None:
             return 'No open connection to close'
         else:
@@ -201,3 +211,6 @@ class ConnectionManager(object):
         """
         logger.info('Executing : Set Auto Commit')
         self._dbconnection.autocommit = autoCommit
+
+    def _clear_assertion_cache(self):
+        self._assertion_cache.clear()
@@ -12,9 +12,45 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import functools
+import os
+import re
 import sys
 from robot.api import logger
 
+_IDENT_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_\.]*$')
+
+
+def _checked_identifier(identifier):
+    if not _IDENT_RE.match(identifier):
+        raise ValueError("'%s' is not a valid SQL identifier" % identifier)
+    return identifier
+
+
+# The builders below validate the schema and table names they interpolate and memoize the resulting SQL, so repeated
+# assertions on the same tables reuse the same statement. Column arguments are interpolated as given since they may
+# hold expressions such as composite keys.
+@functools.lru_cache(maxsize=512)
+def _build_count_sql(schema_name, table_name, unique_key=None):
+    source = '%s.%s' % (_checked_identifier(schema_name), _checked_identifier(table_name))
+    if unique_key is None:
+        return 'SELECT COUNT(*) FROM %s' % source
+    return 'SELECT COUNT(DISTINCT %s) FROM %s' % (unique_key, source)
+
+
+@functools.lru_cache(maxsize=512)
+def _build_compare_tables_sql(schema_name_a, table_name_a, schema_name_b, table_name_b):
+    for identifier in (schema_name_a, table_name_a, schema_name_b, table_name_b):
+        _checked_identifier(identifier)
+    return f'select \'select * from {schema_name_a}.{table_name_a} full outer join {schema_name_b}.{table_name_b} on \' || listagg(\'{table_name_a}.\' || column_name || \' = {table_name_b}.\' || column_name, \' and \' ) within group (order by table_name) || \' where {table_name_a}.\' || any_value(column_name) || \' is null or {table_name_b}.\' || any_value(column_name) || \' is null;\' from information_schema.columns where table_schema = \'RESULT\' and table_name = \'{table_name_b}\' group by table_name;'
+
+
+@functools.lru_cache(maxsize=128)
+def _load_sql_file(path, mtime):
+    # `mtime` is only part of the cache key, so an edited file is read again
+    with open(path) as sqlFile:
+        return sqlFile.read()
+
 
 class Query(object):
     """
@@ -59,6 +95,7 @@ class Query(object):
         try:
             cur = self._dbconnection.cursor()
             logger.info('Executing : Query  |  %s ' % selectStatement)
+            self._clear_assertion_cache()
             self.__execute_sql(cur, selectStatement)
             allRows = cur.fetchall()
 
@@ -106,21 +143,8 @@ class Query(object):
         Using optional `sansTran` to run command without an explicit transaction commit or rollback:
         | ${rowCount} | Row Count | SELECT * FROM person | True |
         """
-        cur = None
-        try:
-            cur = self._dbconnection.cursor()
-            logger.info('Executing : Row Count  |  %s ' % selectStatement)
-            self.__execute_sql(cur, selectStatement)
-            data = cur.fetchall()
-            if self.db_api_module_name in ["sqlite3", "ibm_db", "ibm_db_dbi", "pyodbc"]:
-                rowCount = len(data)
-            else:
-                rowCount = cur.rowcount
-            return rowCount
-        finally:
-            if cur:
-                if not sansTran:
-                    self._dbconnection.rollback()
+        self._clear_assertion_cache()
+        return self._row_count(selectStatement, sansTran)
 
     def description(self, selectStatement, sansTran=False):
         """
@@ -147,6 +171,7 @@ class Query(object):
         try:
             cur = self._dbconnection.cursor()
             logger.info('Executing : Description  |  %s ' % selectStatement)
+            self._clear_assertion_cache()
             self.__execute_sql(cur, selectStatement)
             description = list(cur.description)
             if sys.version_info[0] < 3:
@@ -182,6 +207,7 @@ class Query(object):
         try:
             cur = self._dbconnection.cursor()
             logger.info('Executing : Delete All Rows From Table  |  %s ' % selectStatement)
+            self._clear_assertion_cache()
             result = self.__execute_sql(cur, selectStatement)
             if result is not None:
                 if not sansTran:
@@ -254,33 +280,8 @@ class Query(object):
         try:
             cur = self._dbconnection.cursor()
             logger.info('Executing : Execute SQL Script  |  %s ' % sqlScriptFileName)
-            sqlStatement = ''
-            for line in sqlScriptFile:
-                PY3K = sys.version_info >= (3, 0)
-                if not PY3K:
-                    #spName = spName.encode('ascii', 'ignore')
-                    line = line.strip().decode("utf-8")
-                if line.startswith('#'):
-                    continue
-                elif line.startswith('--'):
-                    continue
-
-                sqlFragments = line.split(';')
-                if len(sqlFragments) == 1:
-                    sqlStatement += line + ' '
-                else:
-                    for sqlFragment in sqlFragments:
-                        sqlFragment = sqlFragment.strip()
-                        if len(sqlFragment) == 0:
-                            continue
-
-                        sqlStatement += sqlFragment + ' '
-
-                        self.__execute_sql(cur, sqlStatement)
-                        sqlStatement = ''
-
-            sqlStatement = sqlStatement.strip()
-            if len(sqlStatement) != 0:
+            self._clear_assertion_cache()
+            for sqlStatement in self._split_sql_script(sqlScriptFile):
                 self.__execute_sql(cur, sqlStatement)
 
             if not sansTran:
@@ -310,6 +311,7 @@ class Query(object):
         try:
             cur = self._dbconnection.cursor()
             logger.info('Executing : Execute SQL String  |  %s ' % sqlString)
+            self._clear_assertion_cache()
             self.__execute_sql(cur, sqlString)
             if not sansTran:
                 self._dbconnection.commit()
@@ -353,6 +355,7 @@ class Query(object):
             if not PY3K:
                 spName = spName.encode('ascii', 'ignore')
             logger.info('Executing : Call Stored Procedure  |  %s  |  %s ' % (spName, spParams))
+            self._clear_assertion_cache()
             cur.callproc(spName, spParams)
             cur.nextset()
             retVal=list()
@@ -367,21 +370,88 @@ class Query(object):
                 if not sansTran:
                     self._dbconnection.rollback()
 
-    def __execute_sql(self, cur, sqlStatement):
-        return cur.execute(sqlStatement)
+    def _split_sql_script(self, sqlScriptFile):
+        """
+        Yields the statements of `sqlScriptFile` as executed by `Execute Sql Script`.
+        """
+        sqlStatement = ''
+        for line in sqlScriptFile:
+            PY3K = sys.version_info >= (3, 0)
+            if not PY3K:
+                #spName = spName.encode('ascii', 'ignore')
+                line = line.strip().decode("utf-8")
+            if line.startswith('#'):
+                continue
+            elif line.startswith('--'):
+                continue
+
+            sqlFragments = line.split(';')
+            if len(sqlFragments) == 1:
+                sqlStatement += line + ' '
+            else:
+                for sqlFragment in sqlFragments:
+                    sqlFragment = sqlFragment.strip()
+                    if len(sqlFragment) == 0:
+                        continue
+
+                    sqlStatement += sqlFragment + ' '
+
+                    yield sqlStatement
+                    sqlStatement = ''
+
+        sqlStatement = sqlStatement.strip()
+        if len(sqlStatement) != 0:
+            yield sqlStatement
+
+    def __execute_sql(self, cur, sqlStatement, parameters=None):
+        if parameters is None:
+            return cur.execute(sqlStatement)
+        return cur.execute(sqlStatement, parameters)
 
 # ADDED FUNCTIONALITY BELOW
 
     def compare_tables(self, schema_name_a, table_name_a, schema_name_b, table_name_b):
-        query = f'select \'select * from {schema_name_a}.{table_name_a} full outer join {schema_name_b}.{table_name_b} on \' || listagg(\'{table_name_a}.\' || column_name || \' = {table_name_b}.\' || column_name, \' and \' ) within group (order by table_name) || \' where {table_name_a}.\' || any_value(column_name) || \' is null or {table_name_b}.\' || any_value(column_name) || \' is null;\' from information_schema.columns where table_schema = \'RESULT\' and table_name = \'{table_name_b}\' group by table_name;'
+        query = _build_compare_tables_sql(schema_name_a, table_name_a, schema_name_b, table_name_b)
         result = self.query(query)
 
         return self.row_count(result[0][0])
 
+    def _execute_script_and_compare(self, sqlScriptFileName, schema_name_a, table_name_a, schema_name_b, table_name_b):
+        """
+        Runs `sqlScriptFileName` followed by `Compare Tables`. On Snowflake the script and the query building the
+        comparison are submitted as one multi-statement request; other modules run them one after the other.
+        """
+        if self.db_api_module_name not in ["snowflake.connector"]:
+            self.execute_sql_script(sqlScriptFileName)
+            return self.compare_tables(schema_name_a, table_name_a, schema_name_b, table_name_b)
+
+        with open(sqlScriptFileName) as sqlScriptFile:
+            statements = [statement.strip() for statement in self._split_sql_script(sqlScriptFile)]
+        statements.append(_build_compare_tables_sql(schema_name_a, table_name_a, schema_name_b, table_name_b).rstrip(';'))
+
+        cur = None
+        try:
+            cur = self._dbconnection.cursor()
+            logger.info('Executing : Execute SQL Script And Compare Tables  |  %s ' % sqlScriptFileName)
+            self._clear_assertion_cache()
+            cur.execute(';\n'.join(statements), num_statements=len(statements))
+            for _ in range(len(statements) - 1):
+                cur.nextset()
+            compareStatement = cur.fetchone()[0]
+            self._dbconnection.commit()
+        finally:
+            if cur:
+                cur.close()
+                self._dbconnection.rollback()
+
+        return self.row_count(compareStatement)
+
     def open_sql(self, sqlScriptFileName, sansTran=False):
-        print(open(sqlScriptFileName).read())
-        
-        return open(sqlScriptFileName).read()
+        path = os.path.abspath(sqlScriptFileName)
+        sqlScript = _load_sql_file(path, os.path.getmtime(path))
+        print(sqlScript)
+
+        return sqlScript
 
     def count_object_rows_table(self, schema_name, table_name):
         query = f'SELECT COUNT(*) FROM {schema_name}.{table_name}'
@@ -401,6 +471,12 @@ class Query(object):
 
         return result
 
+    def _count_and_distinct(self, schema_name, table_name, unique_key):
+        query = f'SELECT COUNT(*), COUNT(DISTINCT {unique_key}) FROM {schema_name}.{table_name}'
+        total, distinct = self.query(query)[0]
+
+        return int(total), int(distinct)
+
     def count_unique_rows_table_argument(self, schema_name, table_name, unique_key, argument):
         query = f'SELECT COUNT(DISTINCT {unique_key}) FROM {schema_name}.{table_name} WHERE {argument}'
         result = self.query(query)
@@ -423,4 +499,82 @@ class Query(object):
         query = f'WITH rel AS (SELECT {unique_key} FROM {schema_name}.{table_name}) SELECT COUNT(DISTINCT {foreign_key}) FROM rel LEFT OUTER JOIN {foreign_table_name} ON {foreign_key} = {unique_key}'
         result = self.query(query)
         
-        return result
\ No newline at end of file
+        return result
+
+    def _row_count(self, selectStatement, sansTran=False):
+        cur = None
+        try:
+            cur = self._dbconnection.cursor()
+            logger.info('Executing : Row Count  |  %s ' % selectStatement)
+            self.__execute_sql(cur, selectStatement)
+            data = cur.fetchall()
+            if self.db_api_module_name in ["sqlite3", "ibm_db", "ibm_db_dbi", "pyodbc"]:
+                rowCount = len(data)
+            else:
+                rowCount = cur.rowcount
+            return rowCount
+        finally:
+            if cur:
+                if not sansTran:
+                    self._dbconnection.rollback()
+
+    def _execute(self, sqlStatement, sansTran=False):
+        cur = None
+        try:
+            cur = self._dbconnection.cursor()
+            self.__execute_sql(cur, sqlStatement)
+        finally:
+            if cur:
+                cur.close()
+                if not sansTran:
+                    self._dbconnection.rollback()
+
+    def _stream_query(self, selectStatement, sansTran=False, batchSize=5):
+        """
+        Yields the rows of `selectStatement` while fetching only `batchSize` rows at a time. On psycopg2 a named
+        (server-side) cursor is used inside transactions, so the rows are not all sent to the client on execute.
+        Close the generator to release the cursor when not all rows are consumed.
+        """
+        cur = None
+        try:
+            if self.db_api_module_name in ["psycopg2"] and not self._dbconnection.autocommit:
+                cur = self._dbconnection.cursor(name='robot_stream_query')
+            else:
+                cur = self._dbconnection.cursor()
+            cur.arraysize = batchSize
+            self.__execute_sql(cur, selectStatement)
+            while True:
+                rows = cur.fetchmany(batchSize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            if cur:
+                cur.close()
+                if not sansTran:
+                    self._dbconnection.rollback()
+
+    def _fetchmany(self, selectStatement, size, sansTran=False):
+        cur = None
+        try:
+            cur = self._dbconnection.cursor()
+            self.__execute_sql(cur, selectStatement)
+            return cur.fetchmany(size)
+        finally:
+            if cur:
+                cur.close()
+                if not sansTran:
+                    self._dbconnection.rollback()
+
+    def _fetchone(self, selectStatement, sansTran=False, parameters=None):
+        cur = None
+        try:
+            cur = self._dbconnection.cursor()
+            self.__execute_sql(cur, selectStatement, parameters)
+            return cur.fetchone()
+        finally:
+            if cur:
+                cur.close()
+                if not sansTran:
+                    self._dbconnection.rollback()
@@ -0,0 +1,2 @@
+SELECT id FROM person
+-- all persons